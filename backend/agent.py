@@ -4,18 +4,68 @@ while adhering to policy checks to ensure safe and relevant assistance.
 """
 
 import os
+import re
+import sys
+import hashlib
+import time
+import asyncio
+from functools import lru_cache
 from dotenv import load_dotenv
 import json
-from openai import OpenAI
-from backend.tools import TOOLS, execute_tool, tool_result_to_str
+import httpx
+from openai import AsyncOpenAI
+from backend.tools import TOOLS, TOOLS_JSON_BYTES, execute_tool, tool_result_to_bytes
+from backend.synthetic_data import MEDICATIONS
 from backend.policy import check_user_policy_violation
 
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+except ImportError:     # orjson is optional - fall back to the stdlib encoder
+    _json_loads = json.loads
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False).encode
+
+    def _json_dumps(obj):
+        """Encode an object as compact UTF-8 JSON bytes."""
+        return _encode(obj).encode("utf-8")
+
+
+# Pre-encoded SSE frames (bytes) - only the variable payload is serialized per event
+_DONE_FRAME = b'data: {"type":"done"}\n\n'
+
+
+def _token_frame(content):
+    """SSE frame for a chunk of response text."""
+    return b'data: {"type":"token","content":' + _json_dumps(content) + b'}\n\n'
+
+
+def _tool_frame(name, args, result_bytes):
+    """SSE frame for an executed tool call (result already JSON-encoded)."""
+    return (b'data: {"type":"tool_call","name":' + _json_dumps(name) + b',"input":' + _json_dumps(args)
+            + b',"output":' + result_bytes + b'}\n\n')
+
+
+def _error_frame(message):
+    """SSE frame for an error message."""
+    return b'data: {"type":"error","content":' + _json_dumps(message) + b'}\n\n'
+
 load_dotenv() 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# One pooled HTTP/2 connection to the API, kept alive across requests (no TLS handshake per turn)
+_http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+    timeout=httpx.Timeout(connect=5.0, read=120.0, write=10.0, pool=5.0),
+)
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=_http_client)
 MODEL = os.getenv("OPENAI_MODEL", "gpt-5")
 
-# System prompt defining the agent's behavior and rules
-SYSTEM_PROMPT = """
+# Core system prompt - policy rules, tools and guidelines, sent on every request as the stable prefix.
+# About 1.1k tokens, not a minimal ~500: the refusal protocol, tool contracts and response rules apply to
+# every turn, so only the worked examples moved to SCENARIOS. Together with the tool schemas (~300 tokens)
+# it also keeps the shared prefix above the 1024-token minimum of OpenAI's automatic prompt caching.
+CORE_PROMPT = """
 You are a pharmacy assistant for a retail pharmacy chain in Israel.
 Your role is to help customers with medication information, stock availability, and prescription verification.
 
@@ -97,7 +147,19 @@ When user names a medication:
   * Rx: Request user ID → Proceed with prescription verification
 </interaction_guidelines>
 
-<workflow_scenarios>
+<critical_reminders>
+1. Your role is purely informational - you are NOT a medical professional
+2. When in doubt, refuse and suggest consulting a healthcare professional
+3. Never proactively offer to check stock, prescriptions, or suggest next steps
+4. Distinguish between availability check ("Is it available?") and purchase request ("I want to buy it")
+5. After refusing a medical advice request, STOP immediately - do not continue with other topics
+</critical_reminders>
+"""
+
+# Workflow scenario exemplars, only the ones relevant to the conversation are appended to the core prompt
+SCENARIOS = {
+    # non-Rx info/stock flow (always included)
+    "info": """
 SCENARIO 1: Non-Prescription Medication
 User: "Tell me about Ibuprofen"
 → Call get_medication_by_name("Ibuprofen")
@@ -108,7 +170,9 @@ User: "Is it in stock?"
 → Call check_inventory(medication_id)
 → Report availability status only
 → STOP
-
+""",
+    # prescription verification
+    "rx": """
 SCENARIO 2: Prescription-Required Medication
 User: "Do you have Amoxicillin?"
 → Call get_medication_by_name("Amoxicillin")
@@ -124,13 +188,17 @@ User: "Is it in stock?"
 → Call check_inventory(medication_id)
 → Report availability
 → STOP
-
+""",
+    # out of stock
+    "out_of_stock": """
 SCENARIO 3: Out of Stock
 → Call check_inventory → in_stock=False
 → Respond: "[Medication] is currently out of stock at this branch. If you have any other questions, I'm here to help."
 → Do NOT suggest other branches or when to restock
 → If user asks "What can I take instead?" → REFUSE (medical advice) → STOP
-
+""",
+    # purchase request
+    "purchase": """
 SCENARIO 4: Purchase Request (keywords: "buy", "purchase", "get it", "I want it", "לרכוש", "לקנות")
 For Non-Rx medication:
 → Call check_inventory
@@ -141,139 +209,232 @@ For Rx medication:
 → Verify prescription first
 → If valid + in stock: Route to pharmacist counter
 → If no valid prescription: "No valid prescription on file." → STOP
-
+""",
+    # medication not found
+    "not_found": """
 SCENARIO 5: Medication Not Found
 → get_medication_by_name returns None or {"error": "Medication not found"}
 → Respond: "I don't have information about [medication name]."
 → STOP (do not suggest alternatives)
-</workflow_scenarios>
+""",
+}
 
-<critical_reminders>
-1. Your role is purely informational - you are NOT a medical professional
-2. When in doubt, refuse and suggest consulting a healthcare professional
-3. Never proactively offer to check stock, prescriptions, or suggest next steps
-4. Distinguish between availability check ("Is it available?") and purchase request ("I want to buy it")
-5. After refusing a medical advice request, STOP immediately - do not continue with other topics
-</critical_reminders>
-"""
+# Shared key so every request lands on the same vendor-side cache for the stable prefix (core prompt + tool schemas).
+# Derived from the prefix itself, so it changes whenever the prompt or the tools change
+_PREFIX_DIGEST = hashlib.sha256(CORE_PROMPT.encode("utf-8") + TOOLS_JSON_BYTES).hexdigest()[:12]
+PROMPT_CACHE_KEY = os.getenv("OPENAI_PROMPT_CACHE_KEY", f"pharmacy-agent-{_PREFIX_DIGEST}")
 
-# Function to handle streaming chat responses
-def stream_chat(messages):
+# Cheap text triggers that load a scenario from the conversation itself (before any tool has run this turn)
+_RX_MEDICATION_NAMES = [name for m in MEDICATIONS if m["requires_prescription"] for name in (m["name"], m["name_he"])]
+_SCENARIO_TRIGGERS = {
+    "rx": re.compile("|".join([r"\b\d{9}\b", r"prescription", r"מרשם", *map(re.escape, _RX_MEDICATION_NAMES)]), re.IGNORECASE),
+    "out_of_stock": re.compile(r"out of stock|not in stock|unavailable|לא במלאי|אזל", re.IGNORECASE),
+    "purchase": re.compile(r"\b(buy|purchase|get it|i want it)\b|לרכוש|לקנות", re.IGNORECASE),
+}
+
+
+def _detect_scenarios(messages):
+    """Scenario keys suggested by the conversation text."""
+    text = "\n".join(m.get("content") or "" for m in messages if isinstance(m.get("content"), str))
+    return {"info"} | {key for key, trigger in _SCENARIO_TRIGGERS.items() if trigger.search(text)}
+
+
+def _scenarios_from_tool(name, result):
+    """Scenario keys implied by a tool result."""
+    keys = set()
+    if name == "verify_user_prescription" or result.get("requires_prescription"):
+        keys.add("rx")
+    if result.get("in_stock") is False:
+        keys.add("out_of_stock")
+    if result.get("error") == "Medication not found":
+        keys.add("not_found")
+    return keys
+
+
+@lru_cache(maxsize=None)
+def _system_message(scenario_keys):
+    """System message: the stable core prompt followed by the selected scenarios (built once per combination)."""
+    scenarios = "".join(SCENARIOS[key] for key in SCENARIOS if key in scenario_keys)
+    return {"role": "system", "content": f"{CORE_PROMPT}\n<workflow_scenarios>{scenarios}</workflow_scenarios>\n"}
+
+
+# Token frames are coalesced and flushed once this many chars are buffered or this many seconds have passed
+TOKEN_FLUSH_CHARS = 48
+TOKEN_FLUSH_INTERVAL = 0.03
+
+# Function to run the policy check on the latest user message
+def get_policy_refusal(messages):
     """
-    Generator that yields SSE-formatted events.
-    Handles tool calls automatically and continues streaming.
+    Check the latest user message against the medical advice policy.
+    Returns the refusal text if it violates the policy, otherwise None.
     """
-    # Policy check on latest user message 
     if messages:    # check if there are messages to process
         last_msg = messages[-1]
         if last_msg.get("role") == "user":
             # Determine if the user's last message violates the policy
             is_violation, refusal = check_user_policy_violation(last_msg.get("content", ""))
             if is_violation:
-                # Return refusal message without calling OpenAI
-                yield f'data: {json.dumps({"type": "token", "content": refusal})}\n\n'
-                yield f'data: {json.dumps({"type": "done"})}\n\n'
-                return
+                return refusal
+    return None
+
+
+# Function to stream a policy refusal without calling OpenAI
+async def refusal_stream(refusal):
+    """Async generator that yields the refusal message as SSE-formatted events."""
+    yield _token_frame(refusal)
+    yield _DONE_FRAME
+
+
+# Function to stream an error without calling OpenAI
+async def error_stream(message):
+    """Async generator that yields an error message as SSE-formatted events."""
+    yield _error_frame(message)
+    yield _DONE_FRAME
+
+
+# Function to handle streaming chat responses
+async def stream_chat(messages, *, temperature=None, seed=None, max_completion_tokens=None, api_client=None):
+    """
+    Async generator that yields SSE-formatted events.
+    Handles tool calls automatically and continues streaming.
+    The caller is responsible for the policy check (see get_policy_refusal).
     
+    Sampling settings are sent only when given - reasoning models (gpt-5) reject any
+    temperature but the default, and count reasoning tokens toward max_completion_tokens.
+    api_client overrides the module's pooled AsyncOpenAI client (e.g. one owned by a test session).
+    """
+    api_client = api_client or client
+    sampling = {
+        key: value for key, value in
+        (("temperature", temperature), ("seed", seed), ("max_completion_tokens", max_completion_tokens))
+        if value is not None
+    }
     # Combine system prompt to establish context for the model before user messages
-    full_messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
+    scenario_keys = _detect_scenarios(messages)
+    full_messages = [_system_message(frozenset(scenario_keys)), *messages]
     
     # Continuously stream responses
     while True:
         try:
             # Request the model's streamed response based on the full messages
-            response = client.chat.completions.create(
+            response = await api_client.chat.completions.create(
                 model=MODEL,
                 messages=full_messages,
                 tools=TOOLS,
-                stream=True
+                prompt_cache_key=PROMPT_CACHE_KEY,
+                stream=True,
+                **sampling
             )
         except Exception as e:            
-            yield f'data: {json.dumps({"type": "error", "content": f"API error: {str(e)}"})}\n\n'            
-            yield f'data: {json.dumps({"type": "done"})}\n\n'            
+            yield _error_frame(f"API error: {str(e)}")            
+            yield _DONE_FRAME            
             return
         
         # Initialize a buffer for accumulating the model's responses as they are streamed 
         accumulated_response = "" 
-        # Initialize a list for requested tool calls
-        tool_calls = []  
-        # Process each chunk of the response
-        current_tool_idx = -1
-        for chunk in response:
-            # Get the delta (change) from the response chunk
-            delta = chunk.choices[0].delta if chunk.choices else None
-            if not delta:
-                continue
-            # Handle content chunks
-            if delta.content:
-                accumulated_response += delta.content
-                yield f'data: {json.dumps({"type": "token", "content": delta.content})}\n\n'
+        # Buffer of streamed text not yet sent to the client (first token is always flushed immediately)
+        token_buffer = ""
+        last_flush = None
+        # Requested tool calls keyed by stream index; argument fragments are joined once the stream ends
+        tool_calls: dict[int, dict] = {}
+        # Process each chunk of the response; leaving the block closes the HTTP stream,
+        # also when the consumer stops early (client disconnect, aclose())
+        async with response:
+            async for chunk in response:
+                # Get the delta (change) from the response chunk
+                delta = chunk.choices[0].delta if chunk.choices else None
+                if not delta:
+                    continue
+                # Handle content chunks
+                if delta.content:
+                    accumulated_response += delta.content
+                    token_buffer += delta.content
+                    now = time.monotonic()
+                    if last_flush is None or len(token_buffer) >= TOKEN_FLUSH_CHARS or now - last_flush >= TOKEN_FLUSH_INTERVAL:
+                        yield _token_frame(token_buffer)
+                        token_buffer = ""
+                        last_flush = now
             
-            # Handle tool calls
-            if delta.tool_calls:
-                for tc in delta.tool_calls:
-                    if tc.index != current_tool_idx:
-                        # Update the current tool index and add the new tool call
-                        current_tool_idx = tc.index
-                        tool_calls.append({
-                            "id": tc.id or "",
-                            "name": tc.function.name or "",
-                            "arguments": tc.function.arguments or ""
-                        })
-                    else:
-                        # If it's the same tool call, update the existing information based on the new data
+                # Handle tool calls
+                if delta.tool_calls:
+                    for tc in delta.tool_calls:
+                        # Get or create the tool call entry, then update it based on the new data
+                        entry = tool_calls.setdefault(tc.index, {"id": "", "name": "", "arguments_parts": []})
                         if tc.id:
-                            tool_calls[current_tool_idx]["id"] = tc.id
+                            entry["id"] = tc.id
                         if tc.function and tc.function.name:
-                            tool_calls[current_tool_idx]["name"] = tc.function.name
+                            entry["name"] = sys.intern(tc.function.name)     # later name checks are pointer compares
                         if tc.function and tc.function.arguments:
-                            tool_calls[current_tool_idx]["arguments"] += tc.function.arguments
+                            entry["arguments_parts"].append(tc.function.arguments)
+        
+        # Flush any remaining buffered text before tool_call/done events
+        if token_buffer:
+            yield _token_frame(token_buffer)
+        
+        # Join the streamed argument fragments of each tool call
+        for entry in tool_calls.values():
+            entry["arguments"] = "".join(entry.pop("arguments_parts"))
         
-        # Check if medication not found - clear irrelevant context       
-        if "I don't have information" in accumulated_response or "אין לי מידע" in accumulated_response:            
-            # # Keep only system prompt and last user message            
-            full_messages = [                
-                {"role": "system", "content": SYSTEM_PROMPT},                
-                messages[-1] if messages else {}            
-            ]
-
         # Check the finish reason of the response
         finish_reason = chunk.choices[0].finish_reason if chunk.choices else None
         
         # End the stream if the finish reason is not related to tool calls
         if finish_reason != "tool_calls" or not tool_calls:
-            yield f'data: {json.dumps({"type": "done"})}\n\n'
+            yield _DONE_FRAME
             return
         
         # Create an assistant message with the collected content and tool call details
-        assistant_msg = {"role": "assistant", "content": accumulated_response or None, "tool_calls": []}
-        for tc in tool_calls:
-            assistant_msg["tool_calls"].append({
-                "id": tc["id"],
-                "type": "function",
-                "function": {"name": tc["name"], "arguments": tc["arguments"]}
-            })
-        full_messages.append(assistant_msg)
+        assistant_msg = {
+            "role": "assistant",
+            "content": accumulated_response or None,
+            "tool_calls": [
+                {"id": tc["id"], "type": "function", "function": {"name": tc["name"], "arguments": tc["arguments"]}}
+                for tc in tool_calls.values()
+            ],
+        }
         
-        # Execute the tools that were requested
-        for tc in tool_calls:
+        # Parse the tool call arguments from JSON
+        for tc in tool_calls.values():
             try:
-                # Load the tool call arguments from JSON
-                args = json.loads(tc["arguments"])
+                tc["args"] = _json_loads(tc["arguments"])
             except json.JSONDecodeError:
-                args = {}
-            
-            # Execute the tool and get the result
-            result = execute_tool(tc["name"], args)
-            # Convert the result to a string for output
-            result_str = tool_result_to_str(result)
+                tc["args"] = {}
+        
+        # Execute the requested tools concurrently in worker threads (so they don't block the event loop);
+        # gather keeps the results in request order
+        results = await asyncio.gather(
+            *(asyncio.to_thread(execute_tool, tc["name"], tc["args"]) for tc in tool_calls.values())
+        )
+        
+        tool_msgs = []
+        medication_not_found = False
+        for tc, result in zip(tool_calls.values(), results):
+            # Encode the result once - reused for the SSE frame and the tool message content
+            result_bytes = tool_result_to_bytes(result)
             
             # Yield the tool call result
-            yield f'data: {json.dumps({"type": "tool_call", "name": tc["name"], "input": args, "output": result})}\n\n'
+            yield _tool_frame(tc["name"], tc["args"], result_bytes)
             
-            # Append the tool result to full messages
-            full_messages.append({
+            # Structured "not found" signal from the lookup tool (instead of scraping the model's text)
+            if tc["name"] == "get_medication_by_name" and result.get("error") == "Medication not found":
+                medication_not_found = True
+            # Load the scenarios this result calls for
+            scenario_keys |= _scenarios_from_tool(tc["name"], result)
+            
+            # Collect the tool result message
+            tool_msgs.append({
                 "role": "tool",
                 "tool_call_id": tc["id"],
-                "content": result_str
-            })
\ No newline at end of file
+                "content": result_bytes.decode("utf-8")
+            })
+        
+        # Check if medication not found - clear irrelevant context
+        if medication_not_found:
+            # Keep only system prompt, last user message and this tool round
+            full_messages[:] = [full_messages[0], messages[-1] if messages else {}, assistant_msg, *tool_msgs]
+        else:
+            # Append the assistant message and tool results to full messages
+            full_messages.append(assistant_msg)
+            full_messages.extend(tool_msgs)
+        # Refresh the system message with any newly needed scenarios (the core prefix stays unchanged)
+        full_messages[0] = _system_message(frozenset(scenario_keys))
\ No newline at end of file
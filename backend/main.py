@@ -2,16 +2,33 @@
 FastAPI app with SSE streaming endpoint.
 """
 
+import asyncio
+import json
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import StreamingResponse, HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 
-from backend.agent import stream_chat
+from backend.agent import client, stream_chat, get_policy_refusal, refusal_stream, error_stream
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:     # orjson is optional - fall back to the stdlib parser
+    _json_loads = json.loads
+
+@asynccontextmanager
+async def lifespan(app):
+    """App lifetime - the agent's pooled API connections are closed on shutdown."""
+    yield
+    await client.close()
+
 
 # Create FastAPI app instance 
-app = FastAPI(title="Pharmacy Agent")
+app = FastAPI(title="Pharmacy Agent", lifespan=lifespan)
 
 # CORS (Cross-Origin Resource Sharing) for local development - allows cross-origin requests between frontend and backend
 app.add_middleware(
@@ -28,16 +45,22 @@ FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
 @app.post("/chat")
 async def chat(request: Request):
     """SSE endpoint — receives messages, streams response."""
-    # Extract messages from the body 
-    body = await request.json() 
+    # Extract messages from the body (parsed straight from the raw bytes)
+    try:
+        body = _json_loads(await request.body())
+    except ValueError:      # malformed JSON (orjson and stdlib errors alike) or invalid UTF-8
+        body = None
+    if not isinstance(body, dict):
+        return StreamingResponse(error_stream("Invalid JSON body"), status_code=400, media_type="text/event-stream")
     messages = body.get("messages", []) 
     
-    def generate():
-        # Generate response events from stream_chat function
-        for event in stream_chat(messages):
-            yield event
+    # Policy check on latest user message - run in a worker thread so a slow scan can't block other streams
+    refusal = await asyncio.to_thread(get_policy_refusal, messages)
+    if refusal:
+        # Return refusal message without calling OpenAI
+        return StreamingResponse(refusal_stream(refusal), media_type="text/event-stream")
     
-    return StreamingResponse(generate(), media_type="text/event-stream")    # Return streaming response
+    return StreamingResponse(stream_chat(messages), media_type="text/event-stream")    # Return streaming response
 
 
 @app.get("/")
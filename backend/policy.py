@@ -4,6 +4,13 @@ Blocks medical advice, diagnosis, and treatment recommendation requests.
 """
 
 import re
+from functools import lru_cache
+import ahocorasick
+
+# Number of recent scan results kept (patterns are fixed at runtime, so cached results never go stale)
+POLICY_CACHE_SIZE = 1024
+# Longer messages are scanned without caching, so the cache never holds oversized keys
+POLICY_CACHE_MAX_CHARS = 4096
 
 # === ENGLISH VIOLATION PATTERNS ===
 INVALID_REQUEST_PATTERNS_EN = [
@@ -32,11 +39,11 @@ INVALID_REQUEST_PATTERNS_EN = [
     r"\bwhich\s+(medication|medicine|drug|pill|remedy)\b",
     
     # === Dosage patterns ===
-    r"\bhow\s+(much|many)\s+.*(to\s+take|should\s+i\s+take)\b",
+    r"\bhow\s+(much|many)\s+.{0,64}?(to\s+take|should\s+i\s+take)\b",
     r"\btoo\s+much\b",
     r"\bis\s+this\s+enough\b",
     r"\benough\s+(medication|medicine|dose)\b",
-    r"\b(increase|decrease|change|adjust|reduce|raise)\s+.*?(dose|dosage|medication|amount)\b",
+    r"\b(increase|decrease|change|adjust|reduce|raise)\s+.{0,64}?(dose|dosage|medication|amount)\b",
     r"\bshould\s+i\s+(increase|decrease|stop|continue|change)\b",
     r"\bcan\s+i\s+(increase|decrease|stop|change|continue)\b",
     r"\bstop\s+taking\b",
@@ -110,6 +117,55 @@ INVALID_REQUEST_PATTERNS_HE = [
     r"\bמה\s+תגיד\b", 
 ]
 
+# === LITERAL KEYWORD ANCHORS ===
+# Every match of the patterns above contains at least one of these keywords, so a message
+# with none of them cannot be a violation and skips the regex scan entirely.
+# Keep these in sync when adding patterns. English keywords are lowercase.
+# Substring keywords are rare stems that may sit inside a longer word ("recommend" in "recommendation");
+# whole-word keywords only count on word boundaries, as they do in the patterns - so "ill" in
+# "Amoxicillin" or "לי" in "אמוקסיצילין" doesn't send a benign message to the regex scan.
+LITERAL_KEYWORDS_EN = [
+    "recommend", "suggest", "advi", "prescribe", "proposal", "opinion",
+    "medic", "drug", "pill", "tablet", "remedy", "dose", "amount", "diagnos",
+]
+WORD_KEYWORDS_EN = [
+    "good", "effective", "safe", "best", "better", "okay", "suitable", "appropriate",
+    "work", "works", "help", "helps", "cure", "fix", "treat", "treatment", "heal", "think", "propose",
+    "take", "use", "try", "stop", "continue", "should", "can", "could", "may", "what",
+    "too", "enough", "increase", "decrease", "change", "wrong", "sick", "ill", "fine",
+    "serious", "dangerous", "urgent", "bad", "normal", "doctor", "physician",
+]
+LITERAL_KEYWORDS_HE = [
+    "מלץ", "מליץ", "מליצ", "מלצ", "ציע", "הצעה", "יעוץ", "ייעץ", "ייעצ", "ספק", "חושב", "דעה", "דעתך",
+    "תרופ", "תכשיר", "אבח", "טיפול", "ריפוי", "פתרון",
+]
+WORD_KEYWORDS_HE = [
+    "טוב", "יעיל", "בטוח", "עדיף", "מתאים", "מומלץ", "עוזר", "יעזור", "עובד", "יעבוד", "מסייע", "הכי",
+    "לקחת", "ליטול", "להשתמש", "לעשות", "צריך", "כדאי", "להמשיך", "להפסיק",
+    "כדור", "מינון", "כמות", "מדי", "מספיק", "די",
+    "להגדיל", "להקטין", "לשנות", "להוריד", "להעלות",
+    "הבעיה", "לי", "חולה", "בסדר", "תקין", "מסוכן", "רציני", "דחוף", "רע", "נורמלי", "רופא",
+    "לטפל", "לרפא", "להתמודד", "עושים", "תגיד",
+]
+
+# Aho-Corasick automaton over all keywords: one linear pass rejects benign messages.
+# Each keyword maps to (length, whole_word)
+_KEYWORDS_AC = ahocorasick.Automaton()
+for _keywords, _whole_word in ((LITERAL_KEYWORDS_EN + LITERAL_KEYWORDS_HE, False),
+                               (WORD_KEYWORDS_EN + WORD_KEYWORDS_HE, True)):
+    for _keyword in _keywords:
+        _KEYWORDS_AC.add_word(_keyword, (len(_keyword), _whole_word))
+_KEYWORDS_AC.make_automaton()
+_WORD_CHAR_RE = re.compile(r"\w")
+# Characters whose lowercase is ASCII (A-Z, "İ" and the Kelvin sign) - the only ones folding can turn into
+# a keyword (Hebrew has no case, other uppercase letters lower to non-ASCII)
+_FOLDS_TO_ASCII_RE = re.compile("[A-Z\u0130\u212a]")
+
+# Each language's patterns compiled once into a single alternation, so a message is scanned in one pass
+_RE_EN = re.compile("|".join(f"(?:{p})" for p in INVALID_REQUEST_PATTERNS_EN), re.IGNORECASE)
+_RE_HE = re.compile("|".join(f"(?:{p})" for p in INVALID_REQUEST_PATTERNS_HE), re.UNICODE)
+_HEBREW_RE = re.compile(r'[\u0590-\u05FF]')
+
 
 # Strict refusal message with no alternative offer for user violation requests in English and Hebrew 
 REFUSAL_RESPONSE_EN = (
@@ -124,7 +180,8 @@ REFUSAL_RESPONSE_HE = (
 # Functions to guide agent if searching for hebrew violation patterns is needed
 def is_hebrew(text):
     """Check if input text contains Hebrew characters."""
-    return bool(re.search(r'[\u0590-\u05FF]', text))
+    # Pure ASCII text can't contain Hebrew - skip the regex
+    return (not text.isascii()) and bool(_HEBREW_RE.search(text))
 
 
 # Functions to detarmine if agent should excute refusal message (user violation occured) 
@@ -133,22 +190,47 @@ def check_user_policy_violation(user_message):
     Check if user message violates medical advice policy.
     Returns (is_violation, refusal_text) tuple.
     """
-    msg_lower = user_message.lower()
-    
+    # The whole message is scanned - the bounded quantifiers keep every pattern linear in its length,
+    # and a violation at the end of a padded message must still be refused
+    if len(user_message) > POLICY_CACHE_MAX_CHARS:
+        return _scan(user_message)
+    return _check_cached(user_message)
+
+
+def _has_keyword(text):
+    """True if the (lowercased) text contains a keyword anchor - whole-word ones on word boundaries only."""
+    for end, (length, whole_word) in _KEYWORDS_AC.iter(text):
+        if not whole_word:
+            return True
+        start = end - length + 1
+        if (start == 0 or not _WORD_CHAR_RE.match(text, start - 1)) and not _WORD_CHAR_RE.match(text, end + 1):
+            return True
+    return False
+
+
+def _scan(user_message):
+    """Scan a user message against the violation patterns."""
+    # Cheap literal prefilter - no keyword means no pattern can match.
+    # Keywords are lowercase, so only fold the message when folding can change a keyword match
+    scan_text = user_message.lower() if _FOLDS_TO_ASCII_RE.search(user_message) else user_message
+    if not _has_keyword(scan_text):
+        return False, None
+
     # Check Hebrew patterns if message contains Hebrew
-    if is_hebrew(user_message):
-        for pattern in INVALID_REQUEST_PATTERNS_HE:
-            if re.search(pattern, user_message):
-                return True, REFUSAL_RESPONSE_HE
-    
-    # Check English patterns
-    for pattern in INVALID_REQUEST_PATTERNS_EN:
-        if re.search(pattern, msg_lower):
-            return True, REFUSAL_RESPONSE_EN
+    if is_hebrew(user_message) and _RE_HE.search(user_message):
+        return True, REFUSAL_RESPONSE_HE
+    
+    # Check English patterns (case-insensitive via the compiled flag)
+    if _RE_EN.search(user_message):
+        return True, REFUSAL_RESPONSE_EN
         
     return False, None
 
 
+# Repeated (short) messages are answered from the cache
+_check_cached = lru_cache(maxsize=POLICY_CACHE_SIZE)(_scan)
+
+
 # Function for matching language of refusal response to user's input
 def get_refusal_text(user_message):
     """Get refusal text in appropriate language."""
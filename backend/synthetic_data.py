@@ -90,36 +90,59 @@ PRESCRIPTIONS = [
     {"id": 6, "user_id": 9, "medication_id": 4, "dosage": "850mg twice daily", "refills_remaining": 4, "expiry_date": "2026-11-15"},
 ]
 
+# Lookup indexes built once at import so every query is a dict hit instead of a list scan
+_MED_BY_ID = {m["id"]: m for m in MEDICATIONS}
+_MED_BY_NAME_LOWER = {m["name"].lower(): m for m in MEDICATIONS}
+_MED_BY_NAME_HE = {m["name_he"]: m for m in MEDICATIONS}
+# Pre-lowered names for the partial match fallback, so .lower() isn't re-run per lookup
+_MED_NAMES = [(m["name"].lower(), m["name_he"], m) for m in MEDICATIONS]
+_USER_BY_ID_NUMBER = {u["id_number"]: u for u in USERS}
+_RX_BY_USER_ID = {}
+for _rx in PRESCRIPTIONS:
+    # Parsed expiry for date comparisons; "expiry_date" stays a string for the tool output.
+    # Lookups compare against date.today() directly - no per-day cached ISO string is needed
+    _rx["_expiry"] = date.fromisoformat(_rx["expiry_date"])
+    _RX_BY_USER_ID.setdefault(_rx["user_id"], []).append(_rx)
+
+
+def _lookup(index, key):
+    """index.get(key), treating an unhashable key (e.g. a list from the model) as a miss."""
+    try:
+        return index.get(key)
+    except TypeError:
+        return None
+
 
 def get_medication_by_name(name):
     """Find medication by name (EN/HE, case-insensitive, partial match)."""
     name_lower = name.lower()
-    for med in MEDICATIONS:
-        if name_lower in med["name"].lower() or name_lower in med["name_he"]:
+    # Exact name hit first, fall back to partial match
+    med = _MED_BY_NAME_LOWER.get(name_lower) or _MED_BY_NAME_HE.get(name)
+    if med:
+        return med
+    for med_name_lower, med_name_he, med in _MED_NAMES:
+        if name_lower in med_name_lower or name_lower in med_name_he:
             return med
     return None
 
 
 def check_inventory(medication_id):
     """Check stock for a medication by ID."""
-    for med in MEDICATIONS:
-        if med["id"] == medication_id:
-            return {
-                "medication_id": med["id"],
-                "name": med["name"],
-                "stock_quantity": med["stock_quantity"],
-                "in_stock": med["stock_quantity"] > 0,
-                "price": med["price"]
-            }
-    return None
+    med = _lookup(_MED_BY_ID, medication_id)
+    if not med:
+        return None
+    return {
+        "medication_id": med["id"],
+        "name": med["name"],
+        "stock_quantity": med["stock_quantity"],
+        "in_stock": med["stock_quantity"] > 0,
+        "price": med["price"]
+    }
 
 
 def get_user_by_id(user_id_number):
     """Find user by ID number."""
-    for user in USERS:
-        if user["id_number"] == user_id_number:
-            return user
-    return None
+    return _lookup(_USER_BY_ID_NUMBER, user_id_number)
 
 
 def get_user_prescriptions(user_id_number):
@@ -128,11 +151,11 @@ def get_user_prescriptions(user_id_number):
     if not user:
         return []
     
-    today = date.today().isoformat()
+    today = date.today()
     results = []
-    for rx in PRESCRIPTIONS:
-        if rx["user_id"] == user["id"] and rx["expiry_date"] >= today:
-            med = next((m for m in MEDICATIONS if m["id"] == rx["medication_id"]), None)
+    for rx in _RX_BY_USER_ID.get(user["id"], ()):
+        if rx["_expiry"] >= today:
+            med = _MED_BY_ID.get(rx["medication_id"])
             if med:
                 results.append({
                     "prescription_id": rx["id"],
@@ -155,9 +178,9 @@ def verify_user_prescription(user_id_number, medication_name):
     if not med:
         return {"has_prescription": False, "error": "Medication not found"}
     
-    today = date.today().isoformat()
-    for rx in PRESCRIPTIONS:
-        if rx["user_id"] == user["id"] and rx["medication_id"] == med["id"] and rx["expiry_date"] >= today:
+    today = date.today()
+    for rx in _RX_BY_USER_ID.get(user["id"], ()):
+        if rx["medication_id"] == med["id"] and rx["_expiry"] >= today:
             return {
                 "has_prescription": True,
                 "medication": med["name"],
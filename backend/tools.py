@@ -3,14 +3,33 @@ Tool definitions + execution for OpenAI function calling.
 """
 
 import json
+import sys
+from operator import itemgetter
 from backend.synthetic_data import (
     get_medication_by_name, check_inventory, verify_user_prescription
 )
 
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps      # C encoder, emits UTF-8 with Hebrew unescaped
+
+    def _json_dumps_str(obj):
+        """Encode an object as compact JSON text."""
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:     # orjson is optional - fall back to the stdlib encoder
+    # One encoder for the module - json.dumps() with options builds a new JSONEncoder per call
+    # (check_circular=False: tool results are plain acyclic dicts)
+    _json_dumps_str = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False).encode
+
+    def _json_dumps(obj):
+        """Encode an object as compact UTF-8 JSON bytes."""
+        return _json_dumps_str(obj).encode("utf-8")
+
 
 # Tool schemas(OpenAI function calling format)
 
-TOOLS = [
+TOOLS = (
     # TOOL 1 - get_medication_by_name
     {
         "type": "function",     # Tells OpenAI this is a function tool
@@ -69,65 +88,92 @@ TOOLS = [
             }
         }
     }
-]
+)
+
+# Schemas serialized once at import (TOOLS is a tuple, so tools can't be added or removed after this snapshot)
+TOOLS_JSON_BYTES = _json_dumps(TOOLS)
+
+
+# Medication fields returned by get_medication_by_name (stock_quantity is internal)
+_MED_FIELDS = (
+    "id", "name", "name_he", "description", "description_he", "active_ingredient",
+    "dosage_form", "standard_dosage", "requires_prescription", "price",
+)
+
+
+# Tool 1 Execution
+def _exec_get_medication(args):
+    """Execute get_medication_by_name."""
+    # Extract medication name from args (default to empty string if missing)
+    med = get_medication_by_name(args.get("medication_name", ""))
+    # If medication not found, return error
+    if med is None:
+        return {"error": "Medication not found"}
+    # Return relevant medication fields
+    return {k: med[k] for k in _MED_FIELDS}
+
+
+# Tool 2 Execution
+def _exec_check_inventory(args):
+    """Execute check_inventory."""
+    # Get medication ID from args
+    med_id = args.get("medication_id")
+    # Validate that medication_id was provided
+    if med_id is None:
+        return {"error": "medication_id is required"}
+    # Call inventory check function
+    stock = check_inventory(med_id)
+    # If medication ID is invalid (a found medication always returns a dict, even an empty one)
+    if stock is None:
+        return {"error": "Medication not found"}
+    # Return stock information
+    return stock
+
+
+# Both verify_user_prescription parameters in one C-level lookup
+_verify_args = itemgetter("user_id", "medication_name")
+
+
+# Tool 3 Execution
+def _exec_verify_prescription(args):
+    """Execute verify_user_prescription."""
+    # Extract both required parameters
+    try:
+        user_id, med_name = _verify_args(args)
+    except KeyError:
+        return {"error": "user_id and medication_name are required"}
+    # Validate both parameters are non-empty
+    if not user_id or not med_name:
+        return {"error": "user_id and medication_name are required"}
+    # Call prescription verification function
+    return verify_user_prescription(user_id, med_name)
+
+
+# Tool name -> executor, looked up once per call
+_DISPATCH = {
+    "get_medication_by_name": _exec_get_medication,
+    "check_inventory": _exec_check_inventory,
+    "verify_user_prescription": _exec_verify_prescription,
+}
 
 
 # Tool excecution  
 def execute_tool(name, args):
     """Execute a tool by name (tool name) with given args (tool paramteres). Returns JSON-serializable dict."""
-    
-    # Tool 1 Execustion
-    if name == "get_medication_by_name":
-        # Extract medication name from args (default to empty string if missing)
-        med = get_medication_by_name(args.get("medication_name", ""))
-        # If medication not found, return error
-        if not med:
-            return {"error": "Medication not found"}    
-        # Return relevant medication fields
-        return {
-            "id": med["id"],
-            "name": med["name"],
-            "name_he": med["name_he"],
-            "description": med["description"],
-            "description_he": med["description_he"],
-            "active_ingredient": med["active_ingredient"],
-            "dosage_form": med["dosage_form"],
-            "standard_dosage": med["standard_dosage"],
-            "requires_prescription": med["requires_prescription"],
-            "price": med["price"]
-        }
-    
-    # Tool 2 Execustion
-    elif name == "check_inventory":
-        # Get medication ID from args
-        med_id = args.get("medication_id")
-        # Validate that medication_id was provided
-        if med_id is None:
-            return {"error": "medication_id is required"}
-        # Call inventory check function
-        stock = check_inventory(med_id)
-        # If medication ID is invalid
-        if not stock:
-            return {"error": "Medication not found"}
-        # Return stock information
-        return stock
-    
-    # Tool 3 Execustion
-    elif name == "verify_user_prescription":
-        # Extract both required parameters
-        user_id = args.get("user_id", "")
-        med_name = args.get("medication_name", "")
-        # Validate both parameters are provided
-        if not user_id or not med_name:
-            return {"error": "user_id and medication_name are required"}
-        # Call prescription verification function
-        return verify_user_prescription(user_id, med_name)
-    
+    # Decoded names are fresh strings; interned ones match the dispatch keys by identity
+    name = sys.intern(name)
+    handler = _DISPATCH.get(name)
     # If tool name doesn't match any known tool
-    else:
+    if handler is None:
         return {"error": f"Unknown tool: {name}"}
+    return handler(args)
+
+
+def tool_result_to_bytes(result):
+    """Convert tool result (python) dict to UTF-8 JSON bytes (e.g. for SSE framing)."""
+    return _json_dumps(result)      # Hebrew characters stay readable (not \u-escaped)
 
 
 def tool_result_to_str(result):
     """Convert tool result (python) dict to (JSON) string for message content."""
-    return json.dumps(result, ensure_ascii=False)       # ensure_ascii=False allows Hebrew characters to remain readable
+    return _json_dumps_str(result)
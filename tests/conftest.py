@@ -0,0 +1,75 @@
+"""
+Shared pytest fixtures
+======================
+
+Record-and-replay for the OpenAI API: every test runs inside a vcrpy cassette
+(tests/cassettes/<test name>.yaml). Runs replay the streamed responses from disk -
+no network, same answers every time.
+
+Record the cassettes with PHARMACY_LIVE=1 (real API, real key) - the first run must be
+a live one. Without it replay is strict: a request with no recorded match fails the test
+instead of going out with the placeholder key (and recording the 401).
+
+Tests are independent API round-trips, so they parallelize across pytest-xdist
+workers: pytest -n 4 --dist loadgroup. Tests that share a batched session fixture
+are kept in one xdist group each, so every batch runs once, on one worker: the
+Flow 1 + 2 demos that read the single-turn prefetch, and all of Flow 3 (the
+Loratadine turn 1). The remaining Flow 1/2 demos and the offline prompt checks
+spread across the other workers.
+
+SPECULATIVE=1 (Flow 3's speculative turn 2, see test_flows.py) is a live-only timing
+mode: its extra request has no match in cassettes recorded without it, and a cassette
+recorded with it wouldn't hold demo 2's own turn 2. It requires PHARMACY_LIVE=1 and
+records nothing - existing cassettes are left as they are.
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import pytest
+import vcr
+from dotenv import load_dotenv
+
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+LIVE = os.getenv("PHARMACY_LIVE") == "1"
+SPECULATIVE = os.getenv("SPECULATIVE") == "1"
+
+load_dotenv()
+if not LIVE:
+    # Replay never reaches the API (record_mode "none"), but the client refuses to start without a key
+    os.environ.setdefault("OPENAI_API_KEY", "sk-replay")
+
+
+# pytest.ini captures DEBUG for the flow transcripts - keep the HTTP/cassette internals out of them
+for _name in ("asyncio", "hpack", "httpcore", "httpx", "openai", "vcr"):
+    logging.getLogger(_name).setLevel(logging.WARNING)
+
+
+def pytest_configure(config):
+    # Registered here too so the mark is known when pytest-xdist isn't installed
+    config.addinivalue_line("markers", "xdist_group(name): run the marked tests on the same xdist worker")
+    if SPECULATIVE and not LIVE:
+        raise pytest.UsageError("SPECULATIVE=1 needs PHARMACY_LIVE=1 - recorded cassettes can't replay a speculative run")
+
+
+@pytest.fixture(scope="session")
+def openai_vcr() -> vcr.VCR:
+    """VCR configured for the chat completions endpoint."""
+    return vcr.VCR(
+        cassette_library_dir=str(CASSETTE_DIR),
+        record_mode="all" if LIVE else "none",
+        # Every call goes to the same URL - the conversation in the body tells them apart
+        match_on=("method", "uri", "body"),
+        filter_headers=("authorization", "openai-organization", "openai-project", "cookie"),
+        decode_compressed_response=True,
+        # A speculative run's requests don't replay as a normal run - keep them out of the cassettes
+        before_record_request=(lambda request: None) if SPECULATIVE else None,
+    )
+
+
+@pytest.fixture(autouse=True)
+def openai_cassette(request, openai_vcr):
+    """Records/replays the API calls made by each test."""
+    with openai_vcr.use_cassette(f"{request.node.name}.yaml"):
+        yield